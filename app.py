@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
 import io
 import os
@@ -54,12 +53,29 @@ def read_csv_with_encoding(file_content, **kwargs):
     # If all encodings fail, raise an error
     raise ValueError("Could not read the file with any supported encoding")
 
+@st.cache_data(show_spinner=False)
+def load_nodes(file_bytes):
+    """Read node.csv from the uploaded bytes, cached across reruns."""
+    return read_csv_with_encoding(io.BytesIO(file_bytes), na_values=['', ' '], thousands=',')
+
+@st.cache_data(show_spinner=False)
+def load_predictions(file_bytes):
+    """Read the predictions workbook from the uploaded bytes, cached across reruns."""
+    return pd.read_excel(io.BytesIO(file_bytes))
+
+@st.cache_resource
+def credential_digests():
+    """Returns SHA-256 digests of the configured username and password, read from secrets once."""
+    return (hashlib.sha256(st.secrets.credentials.username.encode()).digest(),
+            hashlib.sha256(st.secrets.credentials.password.encode()).digest())
+
 def check_password():
     """Returns `True` if the user had the correct password."""
     def password_entered():
         """Checks whether a password entered by the user is correct."""
-        if hmac.compare_digest(st.session_state["username"], st.secrets.credentials.username) and \
-           hmac.compare_digest(st.session_state["password"], st.secrets.credentials.password):
+        username_digest, password_digest = credential_digests()
+        if hmac.compare_digest(hashlib.sha256(st.session_state["username"].encode()).digest(), username_digest) and \
+           hmac.compare_digest(hashlib.sha256(st.session_state["password"].encode()).digest(), password_digest):
             st.session_state["password_correct"] = True
             del st.session_state["password"]  # Don't store the password.
             del st.session_state["username"]  # Don't store the username.
@@ -85,71 +101,81 @@ def check_password():
     else:
         return True
 
-def process_data(nodes_df, predictions_df):
-    """Process the data and return the results DataFrame."""
+@st.cache_data(show_spinner=False)
+def process_data(nodes_df, default_predictions):
+    """Process the data for the predictions with defaults and return the results DataFrame."""
     try:
         # Store original columns order
         original_columns = nodes_df.columns.tolist()
         prediction_columns = ['predicted_defaults', 'actual_defaults_marked', 'avg_drr', 'max_drr', 'prediction_time']
+        trip_keys = ['hub', 'trip_trip_ref_number', 'trip_trip_id']
         
-        # Process each Hub, trip_ref, and trip_trip_id combination that has defaults
-        results = []
+        # Rename the predictions to the output column names, picking the prediction
+        # columns first so an existing 'hub' column can't clash with the renamed 'Hub'
+        default_predictions = default_predictions[
+            ['Hub', 'trip_trip_ref_number', 'trip_trip_id', 'Defaults', 'avg DRR', 'Max DRR', 'Time']
+        ].rename(columns={
+            'Hub': 'hub',
+            'Defaults': 'predicted_defaults',
+            'avg DRR': 'avg_drr',
+            'Max DRR': 'max_drr',
+            'Time': 'prediction_time'
+        })
+        default_predictions = default_predictions.assign(
+            prediction_id=range(len(default_predictions)),
+            predicted_defaults=default_predictions['predicted_defaults'].astype(int)
+        )
         
-        # First, get all trips with defaults
-        default_predictions = predictions_df[predictions_df['Defaults'] > 0].copy()
-        
-        for _, row in default_predictions.iterrows():
-            hub = row['Hub']
-            trip_ref = row['trip_trip_ref_number']
-            trip_trip_id = row['trip_trip_id']
-            num_defaults = int(row['Defaults'])
-            
-            # Get all nodes for this hub, trip reference, and trip_trip_id
-            trip_nodes = nodes_df[
-                (nodes_df['hub'] == hub) & 
-                (nodes_df['trip_trip_ref_number'] == trip_ref) &
-                (nodes_df['trip_trip_id'] == trip_trip_id)
-            ].copy()
-            
-            if len(trip_nodes) > 0:
-                # Get all sequence numbers and sort them
-                sequences = sorted(trip_nodes['visit_sequence'].unique())
-                
-                # If defaults are equal to or greater than number of stops, mark all stops
-                if num_defaults >= len(sequences):
-                    at_risk_sequences = sequences
-                    actual_defaults_to_mark = len(sequences)
-                else:
-                    # Get the last n sequences where n = number of defaults
-                    at_risk_sequences = sequences[-num_defaults:]
-                    actual_defaults_to_mark = num_defaults
-                
-                # Filter nodes to get only the at-risk ones
-                at_risk_nodes = trip_nodes[
-                    trip_nodes['visit_sequence'].isin(at_risk_sequences)
-                ].copy()
-                
-                # Add prediction info to these nodes
-                at_risk_nodes = at_risk_nodes.assign(
-                    predicted_defaults=num_defaults,
-                    actual_defaults_marked=actual_defaults_to_mark,
-                    avg_drr=row['avg DRR'],
-                    max_drr=row['Max DRR'],
-                    prediction_time=row['Time']
-                )
-                
-                results.append(at_risk_nodes)
+        # Join each prediction with all nodes for its hub, trip reference, and trip_trip_id.
+        # Only the key and sequence columns take part, plus each node's row position, so the
+        # wide node rows are gathered once for the at-risk stops instead of through the join.
+        # Predictions with a missing key can't match any node, so they are dropped first.
+        # An inner merge on several keys doesn't keep the left order once some predictions
+        # go unmatched, so the rows are put back in prediction order, then sheet order.
+        node_keys = nodes_df[trip_keys + ['visit_sequence']].assign(node_row=range(len(nodes_df)))
+        merged = default_predictions.dropna(subset=trip_keys).merge(
+            node_keys, on=trip_keys, how='inner'
+        ).sort_values(['prediction_id', 'node_row'], kind='stable', ignore_index=True)
         
-        if results:
-            final_df = pd.concat(results, ignore_index=True)
-            return final_df, original_columns + prediction_columns
-        else:
+        if len(merged) == 0:
             return None, None
+        
+        # Rank the unique sequences of each trip from the first stop; the highest rank
+        # is the trip's number of unique sequences, so no separate nunique pass is needed
+        # Stops with a blank visit_sequence get no rank, so they are neither counted nor marked
+        sequence_rank = merged.groupby('prediction_id')['visit_sequence'].rank(method='dense')
+        num_sequences = sequence_rank.groupby(merged['prediction_id']).transform('max').fillna(0).astype(int)
+        
+        # If defaults are equal to or greater than number of stops, all stops get marked
+        merged['actual_defaults_marked'] = merged['predicted_defaults'].clip(
+            upper=num_sequences
+        )
+        
+        # Keep the last n sequences where n = number of defaults
+        at_risk = merged[sequence_rank > num_sequences - merged['predicted_defaults']].reset_index(drop=True)
+        final_df = nodes_df.iloc[at_risk['node_row'].to_numpy()].reset_index(drop=True).join(
+            at_risk[prediction_columns]
+        )
+        
+        return final_df, original_columns + prediction_columns
             
     except Exception as e:
         st.error(f"Error processing data: {str(e)}")
         return None, None
 
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(final_df, output_columns):
+    """Serialize the results to CSV, cached across reruns."""
+    return final_df[output_columns].to_csv(index=False).encode('utf-8')
+
+@st.cache_data(show_spinner=False)
+def to_excel_bytes(final_df, output_columns):
+    """Serialize the results to an Excel workbook, cached across reruns."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        final_df[output_columns].to_excel(writer, index=False)
+    return output.getvalue()
+
 def main():
     if not check_password():
         st.stop()  # Do not continue if check_password is not True.
@@ -194,7 +220,7 @@ def main():
             # Read the files with additional error handling
             try:
                 st.info("Reading node.csv file...")
-                nodes_df = read_csv_with_encoding(nodes_file, na_values=['', ' '], thousands=',')
+                nodes_df = load_nodes(nodes_file.getvalue())
                 st.success(f"Successfully loaded {len(nodes_df)} records from node.csv")
             except Exception as e:
                 st.error(f"Error reading node.csv: {str(e)}")
@@ -203,7 +229,7 @@ def main():
                 
             try:
                 st.info("Reading predictions file...")
-                predictions_df = pd.read_excel(predictions_file)
+                predictions_df = load_predictions(predictions_file.getvalue())
                 st.success(f"Successfully loaded {len(predictions_df)} predictions")
             except Exception as e:
                 st.error(f"Error reading predictions file: {str(e)}")
@@ -226,6 +252,17 @@ def main():
                 st.info("Available columns: " + ", ".join(predictions_df.columns.tolist()))
                 st.stop()
             
+            # Store the trip keys as categoricals, with both files sharing one set of categories.
+            # astype('category') sorts the categories where it can, also for keys that mix numbers
+            # and text, so groupby output stays in key order.
+            for node_col, pred_col in [('hub', 'Hub'), ('trip_trip_ref_number', 'trip_trip_ref_number'), ('trip_trip_id', 'trip_trip_id')]:
+                key_dtype = pd.concat([nodes_df[node_col], predictions_df[pred_col]]).dropna().astype('category').dtype
+                nodes_df[node_col] = nodes_df[node_col].astype(key_dtype)
+                predictions_df[pred_col] = predictions_df[pred_col].astype(key_dtype)
+            
+            # Get all trips with defaults once, for the overview and the processing
+            default_predictions = predictions_df.loc[predictions_df['Defaults'] > 0]
+            
             # Display data overview
             st.subheader("Data Overview")
             col1, col2, col3, col4 = st.columns(4)
@@ -237,20 +274,23 @@ def main():
             with col3:
                 st.metric("Total Stops", len(nodes_df))
             with col4:
-                st.metric("Predicted Defaults", len(predictions_df[predictions_df['Defaults'] > 0]))
+                st.metric("Predicted Defaults", len(default_predictions))
             
             # Process the data
-            final_df, output_columns = process_data(nodes_df, predictions_df)
+            final_df, output_columns = process_data(nodes_df, default_predictions)
             
             if final_df is not None:
                 st.success(f"Successfully identified {len(final_df)} at-risk stops across {final_df['trip_trip_ref_number'].nunique()} trips")
                 
                 # Create breakdown with trip_trip_id
-                breakdown = final_df.groupby(['hub', 'trip_trip_ref_number', 'trip_trip_id']).agg({
-                    'visit_sequence': ['count', lambda x: sorted(x.unique())],
+                breakdown = final_df.groupby(['hub', 'trip_trip_ref_number', 'trip_trip_id'], observed=True).agg({
+                    'visit_sequence': 'count',
                     'predicted_defaults': 'first',
                     'actual_defaults_marked': 'first'
                 }).round(2)
+                # Sorting by sequence first lets the built-in unique() return each trip's sequences in order
+                breakdown.insert(1, 'Sequences', final_df.sort_values('visit_sequence', kind='stable').groupby(
+                    ['hub', 'trip_trip_ref_number', 'trip_trip_id'], observed=True)['visit_sequence'].unique())
                 breakdown.columns = ['Stops Found', 'Sequences', 'Defaults Predicted', 'Defaults Marked']
                 
                 # Display results
@@ -259,31 +299,30 @@ def main():
                 
                 # Visualization
                 st.subheader("Visualization")
-                fig = px.bar(
-                    breakdown.reset_index(), 
-                    x='trip_trip_ref_number',
-                    y=['Stops Found', 'Defaults Predicted'],
-                    color='trip_trip_id',
-                    title='At-Risk Stops vs Predicted Defaults by Trip',
-                    barmode='group'
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                st.caption("At-Risk Stops vs Predicted Defaults by Trip")
+                chart_data = breakdown.reset_index()
+                chart_data.index = chart_data['trip_trip_ref_number'].astype(str) + ' / ' + chart_data['trip_trip_id'].astype(str)
+                st.bar_chart(chart_data[['Stops Found', 'Defaults Predicted']], stack=False)
                 
                 # Download button
                 st.subheader("Download Results")
                 
-                # Convert to Excel
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    final_df[output_columns].to_excel(writer, index=False)
-                
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 st.download_button(
-                    label="📥 Download Results as Excel",
-                    data=output.getvalue(),
-                    file_name=f'at_risk_stops_{timestamp}.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    label="📥 Download Results as CSV",
+                    data=to_csv_bytes(final_df, output_columns),
+                    file_name=f'at_risk_stops_{timestamp}.csv',
+                    mime='text/csv'
                 )
+                
+                # Excel export is much slower, so only build it when asked for
+                if st.checkbox("Prepare Excel download"):
+                    st.download_button(
+                        label="📥 Download Results as Excel",
+                        data=to_excel_bytes(final_df, output_columns),
+                        file_name=f'at_risk_stops_{timestamp}.xlsx',
+                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    )
             else:
                 st.warning("No at-risk stops found in the data. This might be because:\n\n" +
                           "1. No matching reference numbers between the files\n" +
@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 import os
 
 def generate_sample_input(output_file="data/sample_input.xlsx"):
@@ -10,61 +9,48 @@ def generate_sample_input(output_file="data/sample_input.xlsx"):
     # Create data directory if it doesn't exist
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
+    rng = np.random.default_rng()
+    now = pd.Timestamp.now()
+    
     # Generate nodes data
     hubs = ['HUB001', 'HUB002', 'HUB003']
     trip_refs = [f'TR{i:03d}' for i in range(1, 11)]
     trip_ids = [f'TID{i:04d}' for i in range(1, 21)]
     
-    # Create node data with multiple stops per trip
-    nodes_data = []
-    for hub in hubs:
-        for trip_ref in trip_refs[:5]:  # Each hub has 5 trip refs
-            for trip_id in trip_ids[:2]:  # Each trip ref has 2 trip ids
-                num_stops = np.random.randint(5, 15)  # Random number of stops between 5 and 15
-                for seq in range(1, num_stops + 1):
-                    nodes_data.append({
-                        'hub': hub,
-                        'trip_trip_ref_number': trip_ref,
-                        'trip_trip_id': trip_id,
-                        'visit_sequence': seq,
-                        'customer_name': f'Customer_{np.random.randint(1, 100)}',
-                        'order_id': f'ORD{np.random.randint(10000, 99999)}',
-                        'delivery_date': (datetime.now() + timedelta(days=np.random.randint(1, 10))).strftime('%Y-%m-%d'),
-                        'slots_start_time': (datetime.now() + timedelta(hours=np.random.randint(1, 24))).strftime('%H:%M:%S'),
-                        'slots_end_time': (datetime.now() + timedelta(hours=np.random.randint(1, 24))).strftime('%H:%M:%S'),
-                    })
+    # Each hub has 5 trip refs and each trip ref has 2 trip ids
+    trips = pd.MultiIndex.from_product(
+        [hubs, trip_refs[:5], trip_ids[:2]],
+        names=['hub', 'trip_trip_ref_number', 'trip_trip_id']
+    ).to_frame(index=False)
+    
+    # Create node data with a random number of stops between 5 and 15 per trip
+    num_stops = rng.integers(5, 15, size=len(trips))
+    num_nodes = num_stops.sum()
+    trip_starts = np.repeat(np.cumsum(num_stops) - num_stops, num_stops)
     
-    nodes_df = pd.DataFrame(nodes_data)
+    nodes_df = trips.loc[trips.index.repeat(num_stops)].reset_index(drop=True)
+    nodes_df['visit_sequence'] = np.arange(num_nodes) - trip_starts + 1
+    nodes_df['customer_name'] = 'Customer_' + pd.Series(rng.integers(1, 100, size=num_nodes)).astype(str)
+    nodes_df['order_id'] = 'ORD' + pd.Series(rng.integers(10000, 99999, size=num_nodes)).astype(str)
+    nodes_df['delivery_date'] = (now + pd.to_timedelta(rng.integers(1, 10, size=num_nodes), unit='D')).strftime('%Y-%m-%d')
+    nodes_df['slots_start_time'] = (now + pd.to_timedelta(rng.integers(1, 24, size=num_nodes), unit='h')).strftime('%H:%M:%S')
+    nodes_df['slots_end_time'] = (now + pd.to_timedelta(rng.integers(1, 24, size=num_nodes), unit='h')).strftime('%H:%M:%S')
     
     # Generate predictions data
-    predictions_data = []
-    for hub in hubs:
-        for trip_ref in trip_refs[:5]:  # Each hub has 5 trip refs
-            for trip_id in trip_ids[:2]:  # Each trip ref has 2 trip ids
-                # Only include some trips in predictions (80% chance)
-                if np.random.random() < 0.8:
-                    # Get count of nodes for this trip
-                    node_count = len(nodes_df[(nodes_df['hub'] == hub) & 
-                                              (nodes_df['trip_trip_ref_number'] == trip_ref) & 
-                                              (nodes_df['trip_trip_id'] == trip_id)])
-                    
-                    # Create prediction with defaults (30% chance of having defaults)
-                    if np.random.random() < 0.3 and node_count > 0:
-                        defaults = np.random.randint(1, max(2, node_count))
-                    else:
-                        defaults = 0
-                        
-                    predictions_data.append({
-                        'Hub': hub,
-                        'trip_trip_ref_number': trip_ref,
-                        'trip_trip_id': trip_id,
-                        'Defaults': defaults,
-                        'avg DRR': np.random.uniform(0.01, 0.2),
-                        'Max DRR': np.random.uniform(0.05, 0.4),
-                        'Time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    })
+    # Only include some trips in predictions (80% chance)
+    in_predictions = rng.random(len(trips)) < 0.8
+    
+    # Create prediction with defaults (30% chance of having defaults)
+    has_defaults = rng.random(len(trips)) < 0.3
+    defaults = np.where(has_defaults, rng.integers(1, np.maximum(2, num_stops)), 0)
     
-    predictions_df = pd.DataFrame(predictions_data)
+    num_predictions = in_predictions.sum()
+    predictions_df = trips[in_predictions].rename(columns={'hub': 'Hub'}).reset_index(drop=True).assign(**{
+        'Defaults': defaults[in_predictions],
+        'avg DRR': rng.uniform(0.01, 0.2, size=num_predictions),
+        'Max DRR': rng.uniform(0.05, 0.4, size=num_predictions),
+        'Time': now.strftime('%Y-%m-%d %H:%M:%S')
+    })
     
     # Save to Excel with two sheets
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
@@ -2,8 +2,12 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import os
+import argparse
 
-def main():
+# Rows of node.csv parsed per chunk while streaming the file
+NODES_CHUNK_SIZE = 200_000
+
+def main(verbose=False):
     # File paths
     predictions_file = 'data/Default Predictions.xlsx'
     nodes_file = 'data/node.csv'
@@ -16,12 +20,41 @@ def main():
 
     print("Reading input files...")
     
-    # Read the files
-    predictions_df = pd.read_excel(predictions_file)
-    nodes_df = pd.read_csv(nodes_file,
-                          na_values=['', ' '],
-                          thousands=',',
-                          low_memory=False)
+    # Read the predictions first so node.csv can be filtered while it is read
+    predictions_df = pd.read_excel(predictions_file,
+                                   usecols=['Hub', 'trip_trip_ref_number', 'Defaults', 'avg DRR', 'Max DRR', 'Time'])
+    
+    # Trip keys are matched as text. node.csv keys are always parsed as str, so no chunk
+    # infers its own key type, and the prediction keys are turned into the same text
+    # (whole numbers stored as floats lose their '.0'); missing keys stay missing
+    for pred_col in ['Hub', 'trip_trip_ref_number']:
+        keys = predictions_df[pred_col]
+        if pd.api.types.is_float_dtype(keys) and (keys.dropna() % 1 == 0).all():
+            keys = keys.astype('Int64')
+        predictions_df[pred_col] = keys.astype(str).where(keys.notna())
+    
+    default_keys = pd.MultiIndex.from_frame(
+        predictions_df.loc[predictions_df['Defaults'] > 0, ['Hub', 'trip_trip_ref_number']]
+    )
+    
+    # Stream node.csv in chunks, keeping only the nodes of trips with predicted defaults
+    node_chunks = []
+    total_nodes = 0
+    node_hubs = pd.Index([])
+    node_refs = pd.Index([])
+    for chunk in pd.read_csv(nodes_file,
+                             na_values=['', ' '],
+                             thousands=',',
+                             dtype={'hub': str, 'trip_trip_ref_number': str},
+                             low_memory=False,
+                             chunksize=NODES_CHUNK_SIZE):
+        total_nodes += len(chunk)
+        if verbose:
+            node_hubs = node_hubs.append(pd.Index(chunk['hub'].unique()))
+            node_refs = node_refs.append(pd.Index(chunk['trip_trip_ref_number'].unique()))
+        chunk_keys = pd.MultiIndex.from_frame(chunk[['hub', 'trip_trip_ref_number']])
+        node_chunks.append(chunk[chunk_keys.isin(default_keys)])
+    nodes_df = pd.concat(node_chunks, ignore_index=True)
     
     # Store original columns order
     original_columns = nodes_df.columns.tolist()
@@ -29,104 +62,96 @@ def main():
     
     print(f"\nData Overview:")
     print(f"Predictions file: {len(predictions_df)} records")
-    print(f"Nodes file: {len(nodes_df)} records")
-    
-    # Check hub overlap
-    pred_hubs = set(predictions_df['Hub'])
-    node_hubs = set(nodes_df['hub'])
-    common_hubs = pred_hubs.intersection(node_hubs)
+    print(f"Nodes file: {total_nodes} records ({len(nodes_df)} on trips with predicted defaults)")
     
-    print(f"\nHub Analysis:")
-    print(f"Hubs in predictions: {len(pred_hubs)}")
-    print(f"Hubs in nodes: {len(node_hubs)}")
-    print(f"Common hubs: {len(common_hubs)}")
-    print("Common hub names:", sorted(common_hubs))
-    
-    # Analyze trip reference numbers
-    pred_refs = set(predictions_df['trip_trip_ref_number'])
-    node_refs = set(nodes_df['trip_trip_ref_number'])
-    common_refs = pred_refs.intersection(node_refs)
-    
-    print(f"\nTrip Reference Number Analysis:")
-    print(f"Reference numbers in predictions: {len(pred_refs)}")
-    print(f"Reference numbers in nodes: {len(node_refs)}")
-    print(f"Common reference numbers: {len(common_refs)}")
-    if common_refs:
-        print("Common reference numbers:", sorted(common_refs))
-    
-    # Process each Hub and trip_ref combination that has defaults
-    results = []
-    processed_trips = 0
-    matched_trips = 0
+    if verbose:
+        # Check hub overlap
+        pred_hubs = pd.Index(predictions_df['Hub'].unique())
+        node_hubs = node_hubs.unique()
+        common_hubs = pred_hubs.intersection(node_hubs)
+        
+        print(f"\nHub Analysis:")
+        print(f"Hubs in predictions: {len(pred_hubs)}")
+        print(f"Hubs in nodes: {len(node_hubs)}")
+        print(f"Common hubs: {len(common_hubs)}")
+        print("Common hub names:", sorted(common_hubs))
+        
+        # Analyze trip reference numbers
+        pred_refs = pd.Index(predictions_df['trip_trip_ref_number'].unique())
+        node_refs = node_refs.unique()
+        common_refs = pred_refs.intersection(node_refs)
+        
+        print(f"\nTrip Reference Number Analysis:")
+        print(f"Reference numbers in predictions: {len(pred_refs)}")
+        print(f"Reference numbers in nodes: {len(node_refs)}")
+        print(f"Common reference numbers: {len(common_refs)}")
+        if len(common_refs) > 0:
+            print("Common reference numbers:", sorted(common_refs))
     
     print("\nProcessing predictions...")
 
-    # First, get all trips with defaults
-    default_predictions = predictions_df[predictions_df['Defaults'] > 0].copy()
+    # Store the trip keys as categoricals, with both files sharing one set of categories.
+    # astype('category') sorts the categories where it can, also for keys that mix numbers
+    # and text, so groupby output stays in key order.
+    for node_col, pred_col in [('hub', 'Hub'), ('trip_trip_ref_number', 'trip_trip_ref_number')]:
+        key_dtype = pd.concat([nodes_df[node_col], predictions_df[pred_col]]).dropna().astype('category').dtype
+        nodes_df[node_col] = nodes_df[node_col].astype(key_dtype)
+        predictions_df[pred_col] = predictions_df[pred_col].astype(key_dtype)
+
+    # First, get all trips with defaults, renamed to the output column names.
+    # The prediction columns are picked before renaming so 'Hub' can't clash with a 'hub' column.
+    trip_keys = ['hub', 'trip_trip_ref_number']
+    default_predictions = predictions_df.loc[
+        predictions_df['Defaults'] > 0,
+        ['Hub', 'trip_trip_ref_number', 'Defaults', 'avg DRR', 'Max DRR', 'Time']
+    ].rename(columns={
+        'Hub': 'hub',
+        'Defaults': 'predicted_defaults',
+        'avg DRR': 'avg_drr',
+        'Max DRR': 'max_drr',
+        'Time': 'prediction_time'
+    })
+    default_predictions = default_predictions.assign(
+        prediction_id=np.arange(len(default_predictions)),
+        predicted_defaults=default_predictions['predicted_defaults'].astype(int)
+    )
     print(f"Found {len(default_predictions)} trips with predicted defaults")
     
-    for _, row in default_predictions.iterrows():
-        hub = row['Hub']
-        trip_ref = row['trip_trip_ref_number']
-        num_defaults = int(row['Defaults'])
-        
-        # Get all nodes for this hub and trip reference
-        trip_nodes = nodes_df[
-            (nodes_df['hub'] == hub) & 
-            (nodes_df['trip_trip_ref_number'] == trip_ref)
-        ].copy()
-        
-        if len(trip_nodes) > 0:
-            matched_trips += 1
-            print(f"\nProcessing Hub: {hub}, Trip Ref: {trip_ref}")
-            print(f"Found {len(trip_nodes)} nodes for this trip")
-            
-            # Get all sequence numbers and sort them
-            sequences = sorted(trip_nodes['visit_sequence'].unique())
-            print(f"All sequences: {sequences}")
-            
-            # If defaults are equal to or greater than number of stops, mark all stops
-            if num_defaults >= len(sequences):
-                print(f"Predicted defaults ({num_defaults}) equal to or exceed number of stops ({len(sequences)})")
-                print(f"Marking all {len(sequences)} stops as at-risk")
-                at_risk_sequences = sequences  # Mark all sequences
-                actual_defaults_to_mark = len(sequences)
-            else:
-                # Get the last n sequences where n = number of defaults
-                at_risk_sequences = sequences[-num_defaults:]
-                actual_defaults_to_mark = num_defaults
-            
-            print(f"At risk sequences: {at_risk_sequences}")
-            
-            # Filter nodes to get only the at-risk ones
-            at_risk_nodes = trip_nodes[
-                trip_nodes['visit_sequence'].isin(at_risk_sequences)
-            ].copy()
-            
-            print(f"Found {len(at_risk_nodes)} at-risk nodes with sequences: {sorted(at_risk_nodes['visit_sequence'].unique())}")
-            
-            # Add prediction info to these nodes
-            at_risk_nodes = at_risk_nodes.assign(
-                predicted_defaults=num_defaults,
-                actual_defaults_marked=actual_defaults_to_mark,
-                avg_drr=row['avg DRR'],
-                max_drr=row['Max DRR'],
-                prediction_time=row['Time']
-            )
-            
-            results.append(at_risk_nodes)
-            processed_trips += 1
-        else:
-            print(f"No matching nodes found for Hub: {hub}, Trip Ref: {trip_ref}")
+    # Join each prediction with all nodes for its hub and trip reference.
+    # Only the key and sequence columns take part, plus each node's row position, so the
+    # wide node rows are gathered once for the at-risk stops instead of through the join.
+    # Predictions with a missing key can't match any node, so they are dropped first.
+    # An inner merge on several keys doesn't keep the left order once some predictions
+    # go unmatched, so the rows are put back in prediction order, then file order.
+    node_keys = nodes_df[trip_keys + ['visit_sequence']].assign(node_row=np.arange(len(nodes_df)))
+    merged = default_predictions.dropna(subset=trip_keys).merge(
+        node_keys, on=trip_keys, how='inner'
+    ).sort_values(['prediction_id', 'node_row'], kind='stable', ignore_index=True)
+    matched_trips = merged['prediction_id'].nunique()
+    
+    # Rank the unique sequences of each trip from the first stop; the highest rank
+    # is the trip's number of unique sequences, so no separate nunique pass is needed
+    # Stops with a blank visit_sequence get no rank, so they are neither counted nor marked
+    sequence_rank = merged.groupby('prediction_id')['visit_sequence'].rank(method='dense')
+    num_sequences = sequence_rank.groupby(merged['prediction_id']).transform('max').fillna(0).astype(int)
+    
+    # If defaults are equal to or greater than number of stops, mark all stops
+    merged['actual_defaults_marked'] = merged['predicted_defaults'].clip(
+        upper=num_sequences
+    )
+    
+    # Get the last n sequences where n = number of defaults
+    at_risk = merged[sequence_rank > num_sequences - merged['predicted_defaults']].reset_index(drop=True)
+    final_df = nodes_df.iloc[at_risk['node_row'].to_numpy()].reset_index(drop=True).join(
+        at_risk[prediction_columns]
+    )
 
     print(f"\nMatching Statistics:")
     print(f"Trips with defaults in predictions: {len(default_predictions)}")
     print(f"Trips matched with nodes: {matched_trips}")
 
-    # Combine all results
-    if results:
+    if len(final_df) > 0:
         print("\nGenerating final output...")
-        final_df = pd.concat(results, ignore_index=True)
         
         # Ensure columns are in the right order (original + prediction columns)
         output_columns = original_columns + prediction_columns
@@ -136,18 +161,21 @@ def main():
         output_file = f'data/at_risk_stops_{timestamp}.xlsx'
         
         # Save to Excel with original column order plus prediction columns
-        final_df[output_columns].to_excel(output_file, index=False)
+        final_df[output_columns].to_excel(output_file, index=False, engine='xlsxwriter')
         print(f"\nAnalysis complete!")
         print(f"Found {len(final_df)} at-risk stops across {final_df['trip_trip_ref_number'].nunique()} trips")
         print(f"Output saved to: {output_file}")
         
         # Print detailed breakdown
         print("\nDetailed breakdown of at-risk stops per trip:")
-        breakdown = final_df.groupby(['hub', 'trip_trip_ref_number']).agg({
-            'visit_sequence': ['count', lambda x: sorted(x.unique())],
+        breakdown = final_df.groupby(['hub', 'trip_trip_ref_number'], observed=True).agg({
+            'visit_sequence': 'count',
             'predicted_defaults': 'first',
             'actual_defaults_marked': 'first'
         }).round(2)
+        # Sorting by sequence first lets the built-in unique() return each trip's sequences in order
+        breakdown.insert(1, 'Sequences', final_df.sort_values('visit_sequence', kind='stable').groupby(
+            ['hub', 'trip_trip_ref_number'], observed=True)['visit_sequence'].unique())
         breakdown.columns = ['Stops Found', 'Sequences', 'Defaults Predicted', 'Defaults Marked']
         print(breakdown.to_string())
         
@@ -163,4 +191,8 @@ def main():
         print("3. Hub names don't match between files")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Mark the stops at risk of defaulting in data/node.csv")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print hub and trip reference overlap between the input files")
+    args = parser.parse_args()
+    main(verbose=args.verbose) 
\ No newline at end of file
@@ -1,13 +1,26 @@
-import pandas as pd
-import numpy as np
 import os
+import sys
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Prefer the Rust-based calamine reader for input workbooks; without it pandas
+# picks the engine from the file type (openpyxl for .xlsx, xlrd for .xls)
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+# Input workbooks at least this large have their Nodes sheet streamed in chunks
+STREAM_NODES_MIN_BYTES = 100 * 1024 * 1024
+# Rows of the Nodes sheet turned into a DataFrame at a time while streaming
+NODES_CHUNK_ROWS = 100_000
+
 def process_file(input_file_path, output_file_path):
     """
     Process the input Excel file and write results to the output file.
@@ -17,21 +30,37 @@ def process_file(input_file_path, output_file_path):
                               Expected to have two sheets:
                               - 'Nodes': Delivery trip data with columns hub, trip_trip_ref_number, trip_trip_id, visit_sequence, etc.
                               - 'Predictions': Default predictions with columns Hub, trip_trip_ref_number, trip_trip_id, Defaults, avg DRR, Max DRR, Time
-        output_file_path (str): Path where the output Excel file will be saved
+        output_file_path (str): Path where the output file will be saved; written as Parquet when it
+                                ends in .parquet, otherwise as Excel
     
     Returns:
         bool: True if processing was successful, False otherwise
     """
+    # pandas is imported on first use, so the CLI's usage and missing-file checks start up fast
+    import pandas as pd
+    
     try:
         logger.info(f"Starting to process file: {input_file_path}")
         
         # 1. Read the input Excel file
         logger.info("Reading input file...")
         try:
-            # Read from sheets in the same file
-            nodes_df = pd.read_excel(input_file_path, sheet_name='Nodes', na_values=['', ' '], thousands=',')
-            predictions_df = pd.read_excel(input_file_path, sheet_name='Predictions')
-            logger.info(f"Successfully loaded data: {len(nodes_df)} nodes and {len(predictions_df)} predictions")
+            stream_nodes = (os.path.getsize(input_file_path) >= STREAM_NODES_MIN_BYTES
+                            and input_file_path.lower().endswith(('.xlsx', '.xlsm')))
+            
+            # Open the workbook once and parse both sheets from the same handle,
+            # so only the Nodes sheet gets the blank-cell and thousands handling
+            with pd.ExcelFile(input_file_path, engine=EXCEL_READ_ENGINE) as xl:
+                predictions_df = xl.parse('Predictions')
+                if not stream_nodes:
+                    nodes_df = xl.parse('Nodes', na_values=['', ' '], thousands=',')
+            
+            if stream_nodes:
+                # Large workbooks keep only the nodes of trips with predicted defaults in memory
+                nodes_df, total_nodes = read_nodes_streaming(input_file_path, predictions_df)
+            else:
+                total_nodes = len(nodes_df)
+            logger.info(f"Successfully loaded data: {total_nodes} nodes and {len(predictions_df)} predictions")
         except Exception as e:
             logger.error(f"Error reading Excel file: {str(e)}")
             raise ValueError(f"Error reading Excel file: {str(e)}")
@@ -53,24 +82,28 @@ def process_file(input_file_path, output_file_path):
             logger.error(error_msg)
             raise ValueError(error_msg)
         
+        # Load Defaults as a numeric column so the Defaults > 0 filter compares numbers, not objects
+        predictions_df['Defaults'] = pd.to_numeric(predictions_df['Defaults'])
+        
+        # Store the trip keys as categoricals, with both sheets sharing one set of categories
+        for node_col, pred_col in [('hub', 'Hub'), ('trip_trip_ref_number', 'trip_trip_ref_number'), ('trip_trip_id', 'trip_trip_id')]:
+            key_dtype = pd.CategoricalDtype(pd.concat([nodes_df[node_col], predictions_df[pred_col]]).dropna().unique())
+            nodes_df[node_col] = nodes_df[node_col].astype(key_dtype)
+            predictions_df[pred_col] = predictions_df[pred_col].astype(key_dtype)
+        
         # 2. Process the data (using the core logic from app.py)
         logger.info("Processing data...")
         final_df, output_columns = process_data(nodes_df, predictions_df)
         
         if final_df is None or len(final_df) == 0:
             logger.warning("No at-risk stops found in the data")
-            # Create an empty report with structure information
-            empty_df = pd.DataFrame(columns=['hub', 'trip_trip_ref_number', 'trip_trip_id', 'visit_sequence', 
-                                           'predicted_defaults', 'actual_defaults_marked', 'avg_drr', 'max_drr', 
-                                           'prediction_time', 'process_status'])
-            empty_df.loc[0] = ['', '', '', 0, 0, 0, 0, 0, datetime.now(), 'No at-risk stops found']
-            empty_df.to_excel(output_file_path, index=False)
+            write_output(empty_result_df(), output_file_path)
             logger.info(f"Empty result file created at: {output_file_path}")
             return True
         
         # 3. Write results to the output file
         logger.info(f"Writing {len(final_df)} at-risk stops to {output_file_path}")
-        final_df.to_excel(output_file_path, index=False)
+        write_output(final_df, output_file_path)
         logger.info(f"Processing complete. Results saved to: {output_file_path}")
         
         return True
@@ -86,83 +119,175 @@ def process_file(input_file_path, output_file_path):
             'timestamp': [pd.Timestamp.now()]
         })
         
-        error_df.to_excel(output_file_path, index=False)
+        write_output(error_df, output_file_path)
         return False
 
+def read_nodes_streaming(input_file_path, predictions_df, chunk_rows=NODES_CHUNK_ROWS):
+    """
+    Stream the Nodes sheet in openpyxl's read-only mode, keeping only the nodes of trips with predicted defaults.
+    
+    Args:
+        input_file_path (str): Path to the input Excel file
+        predictions_df (DataFrame): The Predictions sheet, used to pick the trips to keep
+        chunk_rows (int): Number of sheet rows turned into a DataFrame at a time
+    
+    Returns:
+        tuple: (nodes_df, total number of node rows in the sheet)
+    """
+    import itertools
+    import numpy as np
+    import openpyxl
+    import pandas as pd
+    
+    node_keys = ['hub', 'trip_trip_ref_number', 'trip_trip_id']
+    pred_keys = ['Hub', 'trip_trip_ref_number', 'trip_trip_id']
+    
+    # Without the prediction columns no node can be kept; process_file reports the missing columns
+    if all(col in predictions_df.columns for col in pred_keys + ['Defaults']):
+        defaults = pd.to_numeric(predictions_df['Defaults'], errors='coerce').to_numpy()
+        default_keys = pd.MultiIndex.from_frame(predictions_df.loc[defaults > 0, pred_keys])
+    else:
+        default_keys = None
+    
+    workbook = openpyxl.load_workbook(input_file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook['Nodes'].iter_rows(values_only=True)
+        columns = list(next(rows, ()))
+        has_keys = all(col in columns for col in node_keys)
+        
+        node_chunks = []
+        total_nodes = 0
+        while True:
+            chunk = pd.DataFrame(list(itertools.islice(rows, chunk_rows)), columns=columns)
+            if len(chunk) == 0:
+                break
+            # Read-only sheets can report trailing empty rows, which read_excel skips
+            total_nodes += int(chunk.notna().any(axis=1).sum())
+            if default_keys is not None and has_keys:
+                chunk_keys = pd.MultiIndex.from_frame(chunk[node_keys])
+                node_chunks.append(chunk[chunk_keys.isin(default_keys)])
+    finally:
+        workbook.close()
+    
+    node_chunks = [chunk for chunk in node_chunks if len(chunk) > 0]
+    if not node_chunks:
+        return pd.DataFrame(columns=columns), total_nodes
+    
+    # Blank text cells become missing values, as with read_excel's na_values
+    nodes_df = pd.concat(node_chunks, ignore_index=True).replace(['', ' '], np.nan).infer_objects()
+    return nodes_df, total_nodes
+
+def process_files(file_pairs, max_workers=None):
+    """
+    Process several input files in parallel, one worker process per file.
+    
+    Args:
+        file_pairs (list): (input_file_path, output_file_path) tuples, each handled by process_file
+        max_workers (int): Number of worker processes; defaults to one per file, up to the number of CPUs
+    
+    Returns:
+        list: process_file's result for each pair, in the order given
+    """
+    if not file_pairs:
+        return []
+    input_paths, output_paths = zip(*file_pairs)
+    # ProcessPoolExecutor rejects more than 61 workers on Windows, so the CPU-count default is capped there too
+    cpu_limit = min(os.cpu_count() or 1, 61) if sys.platform == 'win32' else (os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(file_pairs), cpu_limit)) as executor:
+        return list(executor.map(process_file, input_paths, output_paths))
+
+def empty_result_df():
+    """Return the one-row report, with structure information, used when no at-risk stops are found."""
+    import pandas as pd
+    
+    empty_df = pd.DataFrame(columns=['hub', 'trip_trip_ref_number', 'trip_trip_id', 'visit_sequence', 
+                                     'predicted_defaults', 'actual_defaults_marked', 'avg_drr', 'max_drr', 
+                                     'prediction_time', 'process_status'])
+    empty_df.loc[0] = ['', '', '', 0, 0, 0, 0, 0, datetime.now(), 'No at-risk stops found']
+    return empty_df
+
+def write_output(df, output_file_path):
+    """Write df as Parquet when output_file_path ends in .parquet, otherwise as Excel with xlsxwriter."""
+    if output_file_path.lower().endswith('.parquet'):
+        import pandas as pd
+        
+        # Excel-sourced columns often mix numbers and text, which Parquet can't store in one column,
+        # so object columns (and categoricals over object values) are written as strings
+        text_columns = [
+            col for col, dtype in df.dtypes.items()
+            if dtype == object or (isinstance(dtype, pd.CategoricalDtype) and dtype.categories.dtype == object)
+        ]
+        df.astype({col: 'string' for col in text_columns}).to_parquet(output_file_path, index=False)
+    else:
+        df.to_excel(output_file_path, index=False, engine='xlsxwriter')
+
 def process_data(nodes_df, predictions_df):
     """Process the data and return the results DataFrame."""
+    import numpy as np
+    
     try:
         # Store original columns order
         original_columns = nodes_df.columns.tolist()
         prediction_columns = ['predicted_defaults', 'actual_defaults_marked', 'avg_drr', 'max_drr', 'prediction_time']
         
-        # Process each Hub, trip_ref, and trip_trip_id combination that has defaults
-        results = []
+        trip_keys = ['hub', 'trip_trip_ref_number', 'trip_trip_id']
         
-        # First, get all trips with defaults
-        default_predictions = predictions_df[predictions_df['Defaults'] > 0].copy()
+        # First, get all trips with defaults, renamed to the output column names.
+        # The prediction columns are picked before renaming, so a frame that also
+        # holds the node columns doesn't end up with two 'hub' columns.
+        default_predictions = predictions_df.loc[
+            predictions_df['Defaults'].to_numpy() > 0,
+            ['Hub', 'trip_trip_ref_number', 'trip_trip_id', 'Defaults', 'avg DRR', 'Max DRR', 'Time']
+        ].rename(columns={
+            'Hub': 'hub',
+            'Defaults': 'predicted_defaults',
+            'avg DRR': 'avg_drr',
+            'Max DRR': 'max_drr',
+            'Time': 'prediction_time'
+        })
+        default_predictions = default_predictions.assign(
+            prediction_id=np.arange(len(default_predictions)),
+            predicted_defaults=default_predictions['predicted_defaults'].astype(int)
+        )
         logger.info(f"Found {len(default_predictions)} trips with predicted defaults")
         
-        matched_trips = 0
+        # Join each prediction with all nodes for its hub, trip reference, and trip_trip_id.
+        # Only the key and sequence columns take part, plus each node's row position, so the
+        # wide node rows are gathered once for the at-risk stops instead of through the join.
+        # Predictions with a missing key can't match any node, so they are dropped first.
+        # An inner merge on several keys doesn't keep the left order once some predictions
+        # go unmatched, so the rows are put back in prediction order, then sheet order.
+        node_keys = nodes_df[trip_keys + ['visit_sequence']].assign(node_row=np.arange(len(nodes_df)))
+        merged = default_predictions.dropna(subset=trip_keys).merge(
+            node_keys, on=trip_keys, how='inner'
+        ).sort_values(['prediction_id', 'node_row'], kind='stable', ignore_index=True)
         
-        for _, row in default_predictions.iterrows():
-            hub = row['Hub']
-            trip_ref = row['trip_trip_ref_number']
-            trip_trip_id = row['trip_trip_id']
-            num_defaults = int(row['Defaults'])
-            
-            logger.info(f"Processing Hub: {hub}, Trip Ref: {trip_ref}, Trip ID: {trip_trip_id}")
-            
-            # Get all nodes for this hub, trip reference, and trip_trip_id
-            trip_nodes = nodes_df[
-                (nodes_df['hub'] == hub) & 
-                (nodes_df['trip_trip_ref_number'] == trip_ref) &
-                (nodes_df['trip_trip_id'] == trip_trip_id)
-            ].copy()
-            
-            if len(trip_nodes) > 0:
-                matched_trips += 1
-                logger.info(f"Found {len(trip_nodes)} nodes for this trip")
-                
-                # Get all sequence numbers and sort them
-                sequences = sorted(trip_nodes['visit_sequence'].unique())
-                
-                # If defaults are equal to or greater than number of stops, mark all stops
-                if num_defaults >= len(sequences):
-                    logger.info(f"Predicted defaults ({num_defaults}) equal to or exceed number of stops ({len(sequences)})")
-                    at_risk_sequences = sequences  # Mark all sequences
-                    actual_defaults_to_mark = len(sequences)
-                else:
-                    # Get the last n sequences where n = number of defaults
-                    at_risk_sequences = sequences[-num_defaults:]
-                    actual_defaults_to_mark = num_defaults
-                
-                logger.info(f"At risk sequences: {at_risk_sequences}")
-                
-                # Filter nodes to get only the at-risk ones
-                at_risk_nodes = trip_nodes[
-                    trip_nodes['visit_sequence'].isin(at_risk_sequences)
-                ].copy()
-                
-                logger.info(f"Found {len(at_risk_nodes)} at-risk nodes")
-                
-                # Add prediction info to these nodes
-                at_risk_nodes = at_risk_nodes.assign(
-                    predicted_defaults=num_defaults,
-                    actual_defaults_marked=actual_defaults_to_mark,
-                    avg_drr=row['avg DRR'],
-                    max_drr=row['Max DRR'],
-                    prediction_time=row['Time']
-                )
-                
-                results.append(at_risk_nodes)
-            else:
-                logger.warning(f"No matching nodes found for Hub: {hub}, Trip Ref: {trip_ref}, Trip ID: {trip_trip_id}")
-
-        logger.info(f"Matched {matched_trips} trips out of {len(default_predictions)} trips with defaults")
+        matched = default_predictions['prediction_id'].isin(merged['prediction_id'])
+        # Unmatched trips are listed one by one only at DEBUG; the summary below covers them at INFO
+        if logger.isEnabledFor(logging.DEBUG):
+            for row in default_predictions[~matched].itertuples(index=False):
+                logger.debug("No matching nodes found for Hub: %s, Trip Ref: %s, Trip ID: %s",
+                             row.hub, row.trip_trip_ref_number, row.trip_trip_id)
+        logger.info(f"Matched {matched.sum()} trips out of {len(default_predictions)} trips with defaults")
+        
+        # Rank the unique sequences of each trip from the first stop; the highest rank
+        # is the trip's number of unique sequences, so no separate nunique pass is needed
+        # Stops with a blank visit_sequence get no rank, so they are neither counted nor marked
+        sequence_rank = merged.groupby('prediction_id')['visit_sequence'].rank(method='dense')
+        num_sequences = sequence_rank.groupby(merged['prediction_id']).transform('max').fillna(0).astype(int)
+        
+        # If defaults are equal to or greater than number of stops, all stops get marked
+        merged['actual_defaults_marked'] = merged['predicted_defaults'].clip(
+            upper=num_sequences
+        )
+        
+        # Keep the last n sequences where n = number of defaults
+        at_risk = merged[sequence_rank > num_sequences - merged['predicted_defaults']].reset_index(drop=True)
+        final_df = nodes_df.iloc[at_risk['node_row'].to_numpy()].reset_index(drop=True).join(
+            at_risk[prediction_columns]
+        )
         
-        if results:
-            final_df = pd.concat(results, ignore_index=True)
+        if len(final_df) > 0:
             return final_df, original_columns + prediction_columns
         else:
             logger.warning("No at-risk stops could be identified")
@@ -173,18 +298,19 @@ def process_data(nodes_df, predictions_df):
         raise
 
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) != 3:
-        print("Usage: python processor.py <input_file> <output_file>")
+    if len(sys.argv) < 3 or len(sys.argv) % 2 == 0:
+        print("Usage: python processor.py <input_file> <output_file> [<input_file> <output_file> ...]")
         sys.exit(1)
-        
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
     
-    if not os.path.exists(input_file):
-        print(f"Error: Input file {input_file} does not exist")
-        sys.exit(1)
-        
-    result = process_file(input_file, output_file)
-    sys.exit(0 if result else 1) 
\ No newline at end of file
+    file_pairs = list(zip(sys.argv[1::2], sys.argv[2::2]))
+    
+    for input_file, _ in file_pairs:
+        if not os.path.exists(input_file):
+            print(f"Error: Input file {input_file} does not exist")
+            sys.exit(1)
+    
+    if len(file_pairs) == 1:
+        results = [process_file(*file_pairs[0])]
+    else:
+        results = process_files(file_pairs)
+    sys.exit(0 if all(results) else 1) 
\ No newline at end of file
@@ -3,28 +3,31 @@ import os
 import logging
 from datetime import datetime
 import sys
-import tempfile
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Import your existing delay tracker logic here
-# Adjust the path to point to your actual delay-tracker directory
-sys.path.append('/Users/jumbotail/Desktop/delay-tracker')
-
+# Prefer the Rust-based calamine reader for input workbooks; without it pandas
+# picks the engine from the file type (openpyxl for .xlsx, xlrd for .xls)
 try:
-    # Try importing directly if the module is in the Python path
-    from processor import process_data
-    logger.info("Successfully imported delay-tracker modules")
-except ImportError as e:
-    logger.warning(f"Could not import delay-tracker modules directly: {str(e)}")
-    logger.warning("Using dummy implementation.")
-    # Fallback to dummy implementation if imports fail
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+# Adjust the path to point to your actual delay-tracker directory
+DELAY_TRACKER_PATH = '/Users/jumbotail/Desktop/delay-tracker'
 
 # Real implementation using actual delay tracker logic
 def delay_tracker_function(df):
     """Process the delay tracking using the actual processor"""
+    # Import your existing delay tracker logic here, on first use rather than at module import.
+    # An ImportError is left to propagate so process_file can fall back to the dummy implementation.
+    if DELAY_TRACKER_PATH not in sys.path:
+        sys.path.append(DELAY_TRACKER_PATH)
+    from processor import process_data, empty_result_df
+    
     try:
         # Process the dataframe using the core delay tracker logic
         # Since process_data expects nodes_df and predictions_df, we need to split our input
@@ -35,38 +38,17 @@ def delay_tracker_function(df):
             nodes_df = df['Nodes']
             predictions_df = df['Predictions']
         else:
-            # Assume it's already a single DataFrame with the right structure
-            # We'll create a temporary file to use with process_file
-            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as temp_input:
-                temp_input_path = temp_input.name
-            
-            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as temp_output:
-                temp_output_path = temp_output.name
-            
-            # Write the DataFrame to the temporary file with two sheets
-            with pd.ExcelWriter(temp_input_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Nodes', index=False)
-                df.to_excel(writer, sheet_name='Predictions', index=False)
-            
-            # Process using the file-based interface
-            from processor import process_file
-            success = process_file(temp_input_path, temp_output_path)
-            
-            if success:
-                # Read the output
-                result_df = pd.read_excel(temp_output_path)
-                
-                # Clean up temporary files
-                os.unlink(temp_input_path)
-                os.unlink(temp_output_path)
-                
-                return result_df
-            else:
-                raise Exception("Processor failed to process the data")
-        
-        # If we get here, we're using the DataFrame-based interface
+            # A single DataFrame holds both the node and the prediction columns,
+            # so it is passed in memory as both inputs
+            nodes_df = df
+            predictions_df = df
+        
         result_df, _ = process_data(nodes_df, predictions_df)
         
+        if result_df is None:
+            # No at-risk stops: report it the same way processor.process_file does
+            return empty_result_df()
+        
         return result_df
     except Exception as e:
         logger.error(f"Error in delay_tracker_function: {str(e)}")
@@ -118,7 +100,7 @@ def process_file(input_file_path, output_file_path):
         logger.info(f"Processing file {input_file_path} with Delay Tracker tool")
         
         # Read the input Excel file
-        df = pd.read_excel(input_file_path)
+        df = pd.read_excel(input_file_path, engine=EXCEL_READ_ENGINE)
         
         # Log the data shape
         logger.info(f"Input data shape: {df.shape}")
@@ -147,7 +129,7 @@ def process_file(input_file_path, output_file_path):
             result_df = dummy_delay_tracker_function(df)
         
         # Save the result to the output path
-        result_df.to_excel(output_file_path, index=False)
+        result_df.to_excel(output_file_path, index=False, engine='xlsxwriter')
         
         logger.info(f"Successfully processed file. Output saved to {output_file_path}")
         return True
@@ -162,7 +144,7 @@ def process_file(input_file_path, output_file_path):
             'timestamp': [datetime.now()]
         })
         
-        error_df.to_excel(output_file_path, index=False)
+        error_df.to_excel(output_file_path, index=False, engine='xlsxwriter')
         return False
 
 if __name__ == "__main__":